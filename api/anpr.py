@@ -1,23 +1,58 @@
 from dotenv import load_dotenv
 import os
+import hashlib
+import threading
 import cv2
+import numpy as np
 import google.generativeai as genai
-from ultralytics import YOLO
 from PIL import Image
+from ocr_client import ResilientOCRClient, CircuitBreaker, OCRUnavailable, OCRSaturated
 
 load_dotenv()
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+# Point at a local fake OCR server (e.g. http://127.0.0.1:8081) for testing
+GEMINI_API_ENDPOINT = os.getenv('GEMINI_API_ENDPOINT')
 
-genai.configure(api_key=GEMINI_API_KEY)
+OCR_MAX_CONCURRENCY = int(os.getenv('OCR_MAX_CONCURRENCY', '4'))
+OCR_TIMEOUT_SECONDS = float(os.getenv('OCR_TIMEOUT_SECONDS', '10'))
+# How long a request waits for a free OCR slot before giving up with 503
+OCR_QUEUE_TIMEOUT_SECONDS = float(os.getenv('OCR_QUEUE_TIMEOUT_SECONDS', '10'))
+OCR_MAX_RETRIES = int(os.getenv('OCR_MAX_RETRIES', '2'))
+OCR_BREAKER_THRESHOLD = int(os.getenv('OCR_BREAKER_THRESHOLD', '5'))
+OCR_BREAKER_RESET_SECONDS = float(os.getenv('OCR_BREAKER_RESET_SECONDS', '30'))
+
+if GEMINI_API_ENDPOINT:
+    genai.configure(api_key=GEMINI_API_KEY, transport="rest", client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+else:
+    genai.configure(api_key=GEMINI_API_KEY)
 gemini_model = genai.GenerativeModel('gemini-flash-latest')
 
 # Get project root (Viscan/api)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 MODEL_PATH = os.path.join(BASE_DIR, "ml_models", "best.pt")
-yolo_model = YOLO(MODEL_PATH)
+# Loaded on first use, or in the gunicorn master by warm_up() before fork.
+# The predictor isn't thread-safe and requests run in the threadpool.
+yolo_model = None
+_yolo_lock = threading.Lock()
 # -----------------------------------
 
-def get_gemini_ocr(cropped_image):
+def _get_yolo_model():
+    # Caller holds _yolo_lock
+    global yolo_model
+    if yolo_model is None:
+        from ultralytics import YOLO
+        yolo_model = YOLO(MODEL_PATH)
+    return yolo_model
+
+def warm_up():
+    """
+    Load the weights and run one dummy prediction. The first predict builds the
+    predictor and fuses Conv+BN into new tensors; doing it before fork lets workers share them.
+    """
+    with _yolo_lock:
+        _get_yolo_model().predict(np.zeros((640, 640, 3), dtype=np.uint8), verbose=False)
+
+def _gemini_generate(cropped_image):
     """
     Sends the cropped plate image to Gemini 3 Flash.
     Gemini 3 handles fine text (OCR) much better than 1.5.
@@ -28,17 +63,49 @@ def get_gemini_ocr(cropped_image):
     color_converted = cv2.cvtColor(cropped_image, cv2.COLOR_BGR2RGB)
     pil_img = Image.fromarray(color_converted)
     
-    print("1")
     # Updated Prompt for Gemini 3
     prompt = "Read the characters on this vehicle license plate. Output ONLY the alphanumeric text. No spaces, no symbols."
     
-    response = gemini_model.generate_content([prompt, pil_img])
+    # retry=None: ocr_client is the only retry layer. The Google client's default
+    # policy retries 503s for minutes, holding an OCR slot the whole time.
+    response = gemini_model.generate_content(
+        [prompt, pil_img],
+        request_options={"timeout": OCR_TIMEOUT_SECONDS, "retry": None}
+    )
     print(response.text.strip())
     return response.text.strip()
 
-def extract_plate(image_path):
+# Returned instead of plate text when Gemini is down; the stored evidence
+# then goes to manual review like an unregistered plate.
+MANUAL_REVIEW = object()
+
+def _manual_review(cropped_image):
+    return MANUAL_REVIEW
+
+ocr_client = ResilientOCRClient(
+    _gemini_generate,
+    fallback=_manual_review,
+    max_concurrency=OCR_MAX_CONCURRENCY,
+    timeout=OCR_TIMEOUT_SECONDS,
+    queue_timeout=OCR_QUEUE_TIMEOUT_SECONDS,
+    max_retries=OCR_MAX_RETRIES,
+    breaker=CircuitBreaker(OCR_BREAKER_THRESHOLD, OCR_BREAKER_RESET_SECONDS),
+)
+
+def get_gemini_ocr(cropped_image):
     """
-    Detect plate using YOLO and extract text using Gemini API
+    OCR a plate crop through the resilient client.
+    Identical crops that are already being read share one remote call.
+    Returns MANUAL_REVIEW if Gemini can't be reached, raises OCRSaturated
+    if too many reads are already in flight.
+    """
+    key = hashlib.sha256(cropped_image.tobytes()).hexdigest() + str(cropped_image.shape)
+    return ocr_client.read(key, cropped_image)
+
+def extract_plate(image_path, crop_path=None):
+    """
+    Detect plate using YOLO and extract text using Gemini API.
+    If crop_path is given, the detected plate crop is saved there.
     """
     image_path = os.path.abspath(image_path).replace("\\", "/") 
     img = cv2.imread(image_path)
@@ -47,22 +114,30 @@ def extract_plate(image_path):
         print(f"Error: Could not read image at {image_path}")
         return None
 
-    results = yolo_model(image_path)
-
-    for r in results:
-        boxes = r.boxes.xyxy.cpu().numpy()
+    with _yolo_lock:
+        results = _get_yolo_model()(image_path)
+        boxes_per_result = [r.boxes.xyxy.cpu().numpy() for r in results]
 
+    for boxes in boxes_per_result:
         for box in boxes:
             x1, y1, x2, y2 = map(int, box)
             plate_crop = img[y1:y2, x1:x2]
+            if crop_path and not os.path.exists(crop_path):
+                os.makedirs(os.path.dirname(crop_path), exist_ok=True)
+                if not cv2.imwrite(crop_path, plate_crop):
+                    print(f"Error: Could not save plate crop to {crop_path}")
 
             try:
                 plate_text = get_gemini_ocr(plate_crop)
-                # Cleaning up potential newlines or extra text
-                return "".join(plate_text.split()) 
-            except Exception as e:
+            except OCRUnavailable as e:
                 print(f"Gemini API Error: {e}")
+                raise
+            if plate_text is MANUAL_REVIEW:
+                return MANUAL_REVIEW
+            if not plate_text:
                 return None
+            # Cleaning up potential newlines or extra text
+            return "".join(plate_text.split()) 
 
     return None
 
@@ -0,0 +1,110 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import models
+
+# How long a serialized payload is reused before it is rebuilt (seconds)
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "30"))
+
+# Users whose data never changed since versioning was introduced
+_EPOCH = datetime(2000, 1, 1, tzinfo=timezone.utc)
+
+# Payloads are cached per worker, keyed by the shared version in the database
+_lock = threading.Lock()
+_payloads = {}  # (user_id, key) -> (version, expires_at, body)
+
+
+def get_user_version(db: Session, user_id):
+    row = db.get(models.UserDataVersion, user_id)
+    if row is None:
+        return 0, _EPOCH
+    updated = row.updated or _EPOCH
+    if updated.tzinfo is None:
+        # SQLite drops the timezone; we always store UTC
+        updated = updated.replace(tzinfo=timezone.utc)
+    return row.version, updated
+
+
+def bump_user_version(db: Session, *user_ids):
+    """
+    Mark the cached data of the given users as stale.
+    Call after committing any change to their vehicles, violations or wallet.
+    """
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    for user_id in set(user_ids):
+        if user_id is None:
+            continue
+        updated = db.query(models.UserDataVersion).filter(models.UserDataVersion.user_id == user_id).update(
+            {models.UserDataVersion.version: models.UserDataVersion.version + 1, models.UserDataVersion.updated: now},
+            synchronize_session=False
+        )
+        if not updated:
+            db.add(models.UserDataVersion(user_id=user_id, version=1, updated=now))
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another worker created the row first
+            db.rollback()
+            db.query(models.UserDataVersion).filter(models.UserDataVersion.user_id == user_id).update(
+                {models.UserDataVersion.version: models.UserDataVersion.version + 1, models.UserDataVersion.updated: now},
+                synchronize_session=False
+            )
+            db.commit()
+        with _lock:
+            for key in [k for k in _payloads if k[0] == user_id]:
+                del _payloads[key]
+
+
+def _not_modified(request, etag, last_modified):
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [t.strip() for t in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return last_modified <= since
+    return False
+
+
+def cached_user_response(request: Request, db: Session, user_id: int, key: str, build):
+    """
+    Serve a per-user JSON payload with ETag/Last-Modified validators.
+    `build` is only called when the client copy and the server cache are both stale.
+    """
+    version, last_modified = get_user_version(db, user_id)
+    etag = f'W/"{user_id}-{version}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": format_datetime(last_modified, usegmt=True),
+        "Cache-Control": "private, no-cache",
+    }
+    if _not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    now = time.monotonic()
+    with _lock:
+        entry = _payloads.get((user_id, key))
+    if entry and entry[0] == version and entry[1] > now:
+        body = entry[2]
+    else:
+        body = json.dumps(jsonable_encoder(build())).encode("utf-8")
+        with _lock:
+            _payloads[(user_id, key)] = (version, now + RESPONSE_CACHE_TTL_SECONDS, body)
+            for k in [k for k, v in _payloads.items() if v[1] <= now]:
+                del _payloads[k]
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,166 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from fastapi.encoders import jsonable_encoder
+
+# Seconds between SSE keep-alive comments on an idle stream
+KEEPALIVE_SECONDS = float(os.getenv("EVENTS_KEEPALIVE_SECONDS", "15"))
+# Events buffered per subscriber before the oldest are dropped
+SUBSCRIBER_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "100"))
+# Set to fan events out across workers and nodes through Redis pub/sub
+EVENTS_REDIS_URL = os.getenv("EVENTS_REDIS_URL")
+
+
+class Subscription:
+    """
+    A single listener on a channel. Events are handed over to the
+    subscriber's event loop, so `publish` may be called from any thread.
+    """
+
+    def __init__(self, broker, channel):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def deliver(self, event):
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        if self.queue.full():
+            # Slow consumer: keep the newest events
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class Broker(ABC):
+    """Pub/sub interface used to push events to connected clients."""
+
+    # Whether published events reach subscribers in other processes
+    shared = False
+
+    @abstractmethod
+    def publish(self, channel, event):
+        ...
+
+    @abstractmethod
+    def subscribe(self, channel):
+        ...
+
+    @abstractmethod
+    def unsubscribe(self, subscription):
+        ...
+
+
+class InMemoryBroker(Broker):
+    """Single-process broker; events only reach clients of this worker."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {}  # channel -> set of Subscription
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.deliver(event)
+            except RuntimeError:
+                # Subscriber's loop already closed
+                self.unsubscribe(subscription)
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel)
+        with self._lock:
+            self._subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.channel)
+            if subscriptions:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.channel]
+
+
+class RedisBroker(InMemoryBroker):
+    """
+    Publishes through Redis so every worker (on any node) sees every event.
+    Each process runs one listener thread that hands incoming events to its
+    local subscriptions; it is started on first subscribe, i.e. after fork.
+    """
+
+    shared = True
+
+    def __init__(self, url):
+        import redis
+
+        super().__init__()
+        self._redis = redis.Redis.from_url(url)
+        self._listener = None
+        self._listener_lock = threading.Lock()
+
+    def publish(self, channel, event):
+        self._redis.publish(channel, json.dumps(event))
+
+    def subscribe(self, channel):
+        self._ensure_listener()
+        return super().subscribe(channel)
+
+    def _ensure_listener(self):
+        with self._listener_lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, name="events-redis", daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe("user:*")
+                for message in pubsub.listen():
+                    channel = message["channel"].decode()
+                    InMemoryBroker.publish(self, channel, json.loads(message["data"]))
+            except Exception as e:
+                # Events published while disconnected are lost; clients still
+                # catch up through the cached dashboard endpoints.
+                print(f"Redis event listener error: {e}")
+                time.sleep(1)
+
+
+_broker = RedisBroker(EVENTS_REDIS_URL) if EVENTS_REDIS_URL else InMemoryBroker()
+
+
+def get_broker():
+    return _broker
+
+
+def set_broker(broker):
+    global _broker
+    _broker = broker
+
+
+def user_channel(user_id):
+    return f"user:{user_id}"
+
+
+def publish_user_event(user_id, event_type, data):
+    """Push an event to every open stream of the given user. Call after commit."""
+    if user_id is None:
+        return
+    _broker.publish(user_channel(user_id), {"type": event_type, "data": jsonable_encoder(data)})
+
+
+def format_sse(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
@@ -0,0 +1,86 @@
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeOCRServer:
+    """
+    Local stand-in for the Gemini generateContent REST endpoint.
+    Point the app at it with GEMINI_API_ENDPOINT=http://127.0.0.1:<port>.
+
+    `script` lists HTTP statuses to answer with before replying normally,
+    `delay` slows every reply down, and `hits` counts requests received.
+    """
+
+    def __init__(self, text="MH12AB1234", host="127.0.0.1", port=0):
+        self.text = text
+        self.delay = 0.0
+        self.script = []
+        self.hits = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _next_status(self):
+        with self._lock:
+            self.hits += 1
+            return self.script.pop(0) if self.script else 200
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if not self.path.split("?")[0].endswith(":generateContent"):
+                    return self._reply(404, {"error": {"code": 404, "message": "Not found"}})
+                status = server._next_status()
+                time.sleep(server.delay)
+                if status != 200:
+                    return self._reply(status, {"error": {"code": status, "message": "Fake OCR error"}})
+                self._reply(200, {"candidates": [{
+                    "content": {"parts": [{"text": server.text}], "role": "model"},
+                    "finishReason": "STOP",
+                    "index": 0
+                }]})
+
+            def _reply(self, status, body):
+                data = json.dumps(body).encode("utf-8")
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    # Client gave up (timeout)
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8081
+    server = FakeOCRServer(port=port)
+    print(f"Fake OCR server on {server.url}; set GEMINI_API_ENDPOINT={server.url}")
+    server.httpd.serve_forever()
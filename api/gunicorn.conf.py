@@ -0,0 +1,71 @@
+# Multi-worker deployment:
+#     gunicorn main:app -c gunicorn.conf.py
+#
+# The app (and with it the YOLO weights in anpr.py) is imported and warmed up
+# once in the master before forking, so every worker shares the model pages
+# copy-on-write instead of building its own copy. Each worker logs its PSS
+# after boot to check that sharing holds.
+# For a single process `uvicorn main:app` still works.
+import gc
+import multiprocessing
+import os
+
+# Push events only cross workers with a shared broker (EVENTS_REDIS_URL)
+_default_workers = multiprocessing.cpu_count() if os.getenv("EVENTS_REDIS_URL") else 1
+
+bind = os.getenv("VISCAN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", _default_workers))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+# Heartbeat: the master restarts a worker whose event loop hasn't checked in
+# for this long. It doesn't limit request or SSE stream duration.
+timeout = int(os.getenv("VISCAN_WORKER_TIMEOUT", "30"))
+# Torch threads per worker; the default (one per core) oversubscribes the CPU with several workers
+TORCH_THREADS = int(os.getenv("VISCAN_TORCH_THREADS", "1"))
+
+
+def on_starting(server):
+    import torch
+    import main, events, anpr
+
+    if server.cfg.workers > 1 and not events.get_broker().shared:
+        message = ("More than one worker needs a shared event broker (set EVENTS_REDIS_URL); "
+                   "the in-memory broker only reaches clients of the worker that published.")
+        server.log.error(message)
+        raise RuntimeError(message)
+
+    # Schema and media setup happen once here; workers skip it at startup
+    main.init_storage()
+    os.environ["VISCAN_STORAGE_READY"] = "1"
+    # Don't hand the master's pooled connections down to the workers
+    main.engine.dispose()
+
+    # A single intra-op thread keeps the master from starting an OpenMP pool
+    # the forked workers would inherit in a broken state.
+    torch.set_num_threads(1)
+    anpr.warm_up()
+    server.log.info("YOLO model loaded and fused in master")
+
+
+def pre_fork(server, worker):
+    # Move everything loaded so far out of the GC's reach so collections in
+    # the workers don't touch (and un-share) the preloaded pages.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    import torch
+
+    torch.set_num_threads(TORCH_THREADS)
+
+
+def post_worker_init(worker):
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            stats = dict(line.split(":", 1) for line in f if ":" in line and not line.startswith(" "))
+    except OSError:
+        return
+    # PSS counts shared pages divided by the number of processes sharing them
+    worker.log.info("Worker %s memory: Rss=%s Pss=%s Shared=%s kB", worker.pid,
+                    stats.get("Rss", "?").split()[0], stats.get("Pss", "?").split()[0],
+                    int(stats.get("Shared_Clean", "0 kB").split()[0]) + int(stats.get("Shared_Dirty", "0 kB").split()[0]))
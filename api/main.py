@@ -1,22 +1,36 @@
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from typing import List
 import os
-import uuid
-import shutil
+import time
+import asyncio
 from decimal import Decimal
 from datetime import timedelta
+from contextlib import asynccontextmanager
 
-import models, schemas, auth, database, anpr
+import models, schemas, auth, database, anpr, cache, events, media_store
 from database import engine, get_db
 
-# Create tables
-models.Base.metadata.create_all(bind=engine)
+def init_storage():
+    """
+    Create the database tables and the media directory.
+    Under gunicorn this runs once in the master before workers fork (see gunicorn.conf.py).
+    """
+    models.Base.metadata.create_all(bind=engine)
+    media_store.init_dirs()
 
-app = FastAPI(title="ViScan API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if os.getenv("VISCAN_STORAGE_READY") != "1":
+        init_storage()
+    yield
+
+app = FastAPI(title="ViScan API", lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -27,13 +41,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Mount media directory for static files
-app.mount("/media", StaticFiles(directory="media"), name="media")
-
-# Ensure media directory exists
-MEDIA_DIR = "media"
-if not os.path.exists(MEDIA_DIR):
-    os.makedirs(MEDIA_DIR)
+# Mount media directory for static files (created at startup)
+app.mount("/media", StaticFiles(directory=media_store.MEDIA_DIR, check_dir=False), name="media")
 
 @app.get("/")
 def hello():
@@ -100,36 +109,45 @@ def read_users_me(current_user: models.User = Depends(auth.get_current_active_us
     return current_user
 
 @app.get("/user_dashboard")
-def get_user_dashboard(current_user: models.User = Depends(auth.get_current_active_user), db: Session = Depends(get_db)):
-    vehicles = current_user.vehicles
-    # Get violations for all user's vehicles
-    vehicle_ids = [v.id for v in vehicles]
-    violations = db.query(models.Violation).filter(models.Violation.vehicle_id.in_(vehicle_ids)).order_by(models.Violation.created.desc()).limit(50).all()
-    
-    return {
-        "user": {
-            "username": current_user.username,
-            "email": current_user.email,
-            "wallet_balance": current_user.profile.wallet_balance if current_user.profile else Decimal('0.00')
-        },
-        "vehicles": vehicles,
-        "violations": violations
-    }
+def get_user_dashboard(request: Request, current_user: models.User = Depends(auth.get_current_active_user), db: Session = Depends(get_db)):
+    def build():
+        vehicles = current_user.vehicles
+        # Get violations for all user's vehicles
+        vehicle_ids = [v.id for v in vehicles]
+        violations = db.query(models.Violation).filter(models.Violation.vehicle_id.in_(vehicle_ids)).order_by(models.Violation.created.desc()).limit(50).all()
+
+        return {
+            "user": {
+                "username": current_user.username,
+                "email": current_user.email,
+                "wallet_balance": current_user.profile.wallet_balance if current_user.profile else Decimal('0.00')
+            },
+            "vehicles": vehicles,
+            "violations": [schemas.ViolationResponse.model_validate(v) for v in violations]
+        }
+
+    return cache.cached_user_response(request, db, current_user.id, "user_dashboard", build)
 
 @app.get("/vehicles", response_model=List[schemas.VehicleResponse])
-def get_user_vehicles(current_user: models.User = Depends(auth.get_current_active_user), db: Session = Depends(get_db)):
-    return current_user.vehicles
+def get_user_vehicles(request: Request, current_user: models.User = Depends(auth.get_current_active_user), db: Session = Depends(get_db)):
+    def build():
+        return [schemas.VehicleResponse.model_validate(v) for v in current_user.vehicles]
+
+    return cache.cached_user_response(request, db, current_user.id, "vehicles", build)
 
 @app.post("/vehicles", response_model=schemas.VehicleResponse)
 def create_vehicle(vehicle_in: schemas.VehicleCreate, current_user: models.User = Depends(auth.get_current_active_user), db: Session = Depends(get_db)):
     return add_vehicle(vehicle_in, current_user, db)
 
 @app.get("/violations", response_model=List[schemas.ViolationResponse])
-def get_user_violations(current_user: models.User = Depends(auth.get_current_active_user), db: Session = Depends(get_db)):
-    vehicles = current_user.vehicles
-    vehicle_ids = [v.id for v in vehicles]
-    violations = db.query(models.Violation).filter(models.Violation.vehicle_id.in_(vehicle_ids)).order_by(models.Violation.created.desc()).all()
-    return violations
+def get_user_violations(request: Request, current_user: models.User = Depends(auth.get_current_active_user), db: Session = Depends(get_db)):
+    def build():
+        vehicles = current_user.vehicles
+        vehicle_ids = [v.id for v in vehicles]
+        violations = db.query(models.Violation).filter(models.Violation.vehicle_id.in_(vehicle_ids)).order_by(models.Violation.created.desc()).all()
+        return [schemas.ViolationResponse.model_validate(v) for v in violations]
+
+    return cache.cached_user_response(request, db, current_user.id, "violations", build)
 
 @app.post("/add_vehicle", response_model=schemas.VehicleResponse)
 def add_vehicle(vehicle_in: schemas.VehicleCreate, current_user: models.User = Depends(auth.get_current_active_user), db: Session = Depends(get_db)):
@@ -144,6 +162,7 @@ def add_vehicle(vehicle_in: schemas.VehicleCreate, current_user: models.User = D
     db.add(new_vehicle)
     db.commit()
     db.refresh(new_vehicle)
+    cache.bump_user_version(db, current_user.id)
     return new_vehicle
 
 @app.post("/add_money")
@@ -153,18 +172,32 @@ def add_money(deposit: schemas.WalletDeposit, current_user: models.User = Depend
     
     current_user.profile.wallet_balance += deposit.amount
     db.commit()
+    cache.bump_user_version(db, current_user.id)
+    events.publish_user_event(current_user.id, "wallet_credited", {
+        "amount": deposit.amount,
+        "wallet_balance": current_user.profile.wallet_balance
+    })
     return {"message": "Money added successfully", "new_balance": current_user.profile.wallet_balance}
 
 @app.post("/detect")
 async def detect_violation(image: UploadFile = File(...), db: Session = Depends(get_db)):
-    # Save image
-    filename = f"{uuid.uuid4().hex}_{image.filename}"
-    file_path = os.path.join(MEDIA_DIR, filename)
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(image.file, buffer)
+    # Save image (content-addressed, with thumbnail)
+    try:
+        stored = await run_in_threadpool(media_store.save_upload, image.file)
+    except media_store.InvalidImage:
+        raise HTTPException(status_code=400, detail="Uploaded file is not a supported image")
     
-    # Extract plate
-    plate_raw = anpr.extract_plate(file_path)
+    # Extract plate off the event loop; OCR may wait on the remote service
+    try:
+        plate_raw = await run_in_threadpool(anpr.extract_plate, stored.path, media_store.plate_crop_path(stored.digest))
+    except anpr.OCRSaturated:
+        raise HTTPException(
+            status_code=503,
+            detail="Plate recognition is busy, please retry",
+            headers={"Retry-After": str(int(anpr.OCR_QUEUE_TIMEOUT_SECONDS))}
+        )
+    if plate_raw is anpr.MANUAL_REVIEW:
+        return {"message": "Plate recognition unavailable — manual review required", "image": stored.url, "status": "manual_review"}
     if not plate_raw:
         raise HTTPException(status_code=400, detail="Plate not found")
     
@@ -187,13 +220,23 @@ async def detect_violation(image: UploadFile = File(...), db: Session = Depends(
     amount = Decimal('500.00')
     violation = models.Violation(
         vehicle_id=matching_vehicle.id,
-        image=f"/media/{filename}",
+        image=stored.url,
         amount=amount,
         status="pending"
     )
     db.add(violation)
     db.flush() # Get violation ID
 
+    def notify_owner(wallet_balance=None):
+        # Retention may have discarded the deduplicated file while we ran OCR
+        media_store.ensure_stored(stored)
+        cache.bump_user_version(db, matching_vehicle.user_id)
+        events.publish_user_event(matching_vehicle.user_id, "violation_created", {
+            "violation": schemas.ViolationResponse.model_validate(violation),
+            "plate": plate_raw,
+            "wallet_balance": wallet_balance
+        })
+
     # Automatic deduction logic
     user = matching_vehicle.user
     if user and user.profile:
@@ -202,14 +245,57 @@ async def detect_violation(image: UploadFile = File(...), db: Session = Depends(
             profile.wallet_balance -= amount
             violation.status = "paid"
             db.commit()
+            notify_owner(profile.wallet_balance)
             return {"message": "Violation recorded and wallet debited", "plate": plate_raw}
         else:
             db.commit()
+            notify_owner(profile.wallet_balance)
             return {"message": "Violation recorded — insufficient wallet balance, payment pending", "plate": plate_raw}
     
     db.commit()
+    notify_owner()
     return {"message": "Violation recorded", "plate": plate_raw}
 
+def _resolve_stream_user(token):
+    # Own short-lived session: a get_db dependency would hold a pooled
+    # connection for as long as the stream stays open.
+    db = database.SessionLocal()
+    try:
+        user = auth.get_current_active_user(auth.get_user_from_token(db, token))
+        return user.id
+    finally:
+        db.close()
+
+@app.get("/events")
+async def stream_events(request: Request, token: str = Depends(auth.oauth2_scheme)):
+    # Server-Sent Events stream of the user's violation and wallet updates
+    user_id = await run_in_threadpool(_resolve_stream_user, token)
+    expires_at = auth.decode_token(token)["exp"]
+    subscription = events.get_broker().subscribe(events.user_channel(user_id))
+
+    async def event_stream():
+        try:
+            while not await request.is_disconnected():
+                # End the stream with the token; the client reconnects with a fresh one
+                remaining = expires_at - time.time()
+                if remaining <= 0:
+                    yield "event: token_expired\ndata: {}\n\n"
+                    break
+                try:
+                    event = await asyncio.wait_for(subscription.get(), timeout=min(events.KEEPALIVE_SECONDS, remaining))
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield events.format_sse(event)
+        finally:
+            subscription.close()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/pay_violation/{violation_id}")
 def pay_violation(violation_id: int, current_user: models.User = Depends(auth.get_current_active_user), db: Session = Depends(get_db)):
     violation = db.query(models.Violation).filter(models.Violation.id == violation_id).first()
@@ -230,6 +316,11 @@ def pay_violation(violation_id: int, current_user: models.User = Depends(auth.ge
     profile.wallet_balance -= violation.amount
     violation.status = "paid"
     db.commit()
+    cache.bump_user_version(db, current_user.id)
+    events.publish_user_event(current_user.id, "violation_paid", {
+        "violation_id": violation.id,
+        "wallet_balance": profile.wallet_balance
+    })
     return {"message": "Violation paid successfully"}
 
 # Admin Endpoints
@@ -260,6 +351,7 @@ def admin_add_vehicle(vehicle_in: schemas.AdminVehicleCreate, current_admin: mod
     db.add(new_vehicle)
     db.commit()
     db.refresh(new_vehicle)
+    cache.bump_user_version(db, new_vehicle.user_id)
     return new_vehicle
 
 @app.put("/admin/vehicle/{vehicle_id}", response_model=schemas.VehicleResponse)
@@ -273,12 +365,14 @@ def admin_edit_vehicle(vehicle_id: int, vehicle_in: schemas.AdminVehicleUpdate,
     if existing:
         raise HTTPException(status_code=400, detail="Plate already exists")
     
+    previous_owner_id = vehicle.user_id
     vehicle.plate_number = vehicle_in.plate_number
     if vehicle_in.owner_id:
         vehicle.user_id = vehicle_in.owner_id
     
     db.commit()
     db.refresh(vehicle)
+    cache.bump_user_version(db, previous_owner_id, vehicle.user_id)
     return vehicle
 
 @app.delete("/admin/vehicle/{vehicle_id}")
@@ -287,8 +381,10 @@ def admin_delete_vehicle(vehicle_id: int, current_admin: models.User = Depends(a
     if not vehicle:
         raise HTTPException(status_code=404, detail="Vehicle not found")
     
+    owner_id = vehicle.user_id
     db.delete(vehicle)
     db.commit()
+    cache.bump_user_version(db, owner_id)
     return {"message": "Vehicle deleted successfully"}
 
 # Admin User CRUD
@@ -319,6 +415,7 @@ def admin_update_user(user_id: int, user_in: schemas.AdminUserUpdate, current_ad
             
     db.commit()
     db.refresh(db_user)
+    cache.bump_user_version(db, db_user.id)
     return db_user
 
 @app.delete("/admin/user/{user_id}")
@@ -337,6 +434,7 @@ def admin_delete_user(user_id: int, current_admin: models.User = Depends(auth.ge
         
     db.delete(db_user)
     db.commit()
+    cache.bump_user_version(db, user_id)
     return {"message": "User deleted successfully"}
 
 # Admin Violation CRUD
@@ -357,6 +455,11 @@ def admin_update_violation(violation_id: int, v_in: schemas.AdminViolationUpdate
         
     db.commit()
     db.refresh(violation)
+    owner_id = violation.vehicle.user_id if violation.vehicle else None
+    cache.bump_user_version(db, owner_id)
+    events.publish_user_event(owner_id, "violation_updated", {
+        "violation": schemas.ViolationResponse.model_validate(violation)
+    })
     return violation
 
 @app.delete("/admin/violation/{violation_id}")
@@ -365,6 +468,9 @@ def admin_delete_violation(violation_id: int, current_admin: models.User = Depen
     if not violation:
         raise HTTPException(status_code=404, detail="Violation not found")
     
+    owner_id = violation.vehicle.user_id if violation.vehicle else None
     db.delete(violation)
     db.commit()
+    cache.bump_user_version(db, owner_id)
+    events.publish_user_event(owner_id, "violation_deleted", {"violation_id": violation_id})
     return {"message": "Violation deleted successfully"}
@@ -0,0 +1,118 @@
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from database import SessionLocal
+import models, cache, media_store
+
+
+def _as_utc(dt):
+    # SQLite returns naive UTC timestamps
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt
+
+
+def _referenced(db):
+    urls = {image for (image,) in db.query(models.Violation.image).filter(models.Violation.image.like("/media/%"))}
+    digests = {media_store.digest_from_url(url) for url in urls} - {None}
+    return urls, digests
+
+
+def _is_referenced(rel_path, urls, digests):
+    if rel_path.startswith(("thumbs/", "plates/")):
+        return os.path.basename(rel_path)[:64] in digests
+    return "/media/" + rel_path in urls
+
+
+def run_retention(db, now=None):
+    """
+    Tier the evidence of paid violations, then clean up:
+
+    - recompress: the original is archived, and a smaller re-encode is served
+    - archive: only the thumbnail is served; the original stays in the archive
+    - uploads no violation refers to are discarded after the grace period
+    - discarded files are deleted from the trash after TRASH_DAYS, unless a
+      violation refers to them again, in which case they are restored
+
+    A file shared by several violations is only tiered when all of them qualify.
+    Nothing is deleted outright from the served tree; see media_store.discard.
+    """
+    now = now or datetime.now(timezone.utc)
+    recompress_cutoff = now - timedelta(days=media_store.RECOMPRESS_AFTER_DAYS)
+    archive_cutoff = now - timedelta(days=media_store.ARCHIVE_AFTER_DAYS)
+    stats = defaultdict(int)
+
+    rows = db.query(models.Violation, models.Vehicle.user_id).join(models.Vehicle, isouter=True).filter(
+        models.Violation.image.like("/media/%")
+    ).all()
+    groups = defaultdict(list)
+    for violation, owner_id in rows:
+        if media_store.digest_from_url(violation.image) and not violation.image.startswith("/media/thumbs/"):
+            groups[violation.image].append((violation, owner_id))
+
+    for url, members in groups.items():
+        if any(v.status != "paid" or v.created is None for v, _ in members):
+            continue
+        newest = max(_as_utc(v.created) for v, _ in members)
+        is_recompressed = ".r." in url
+        if media_store.ARCHIVE_AFTER_DAYS and newest <= archive_cutoff:
+            tier = "archived"
+        elif media_store.RECOMPRESS_AFTER_DAYS and newest <= recompress_cutoff and not is_recompressed:
+            tier = "recompressed"
+        else:
+            continue
+
+        path = media_store.local_path(url)
+        if not media_store.restore(path):
+            print(f"Missing evidence file for {url}, skipping")
+            continue
+        # Keep the full-resolution original before serving anything lossier.
+        # A recompressed file's original was archived at the recompress tier.
+        if not is_recompressed:
+            media_store.archive(url)
+
+        if tier == "archived":
+            if not media_store.restore(media_store.thumbnail_path(media_store.digest_from_url(url))):
+                print(f"No thumbnail for {url}, skipping archive")
+                continue
+            new_url = media_store.thumbnail_url(url)
+        else:
+            new_url = media_store.recompress(url)
+
+        for violation, _ in members:
+            violation.image = new_url
+        db.commit()
+        if not db.query(models.Violation).filter(models.Violation.image == url).count():
+            media_store.discard(path)
+        cache.bump_user_version(db, *[owner_id for _, owner_id in members])
+        stats[tier] += 1
+
+    # Re-read references after tiering; compare by file age, not DB rows, so
+    # an upload still in /detect (file touched, violation not yet committed) is kept.
+    urls, digests = _referenced(db)
+    grace_cutoff = time.time() - media_store.UNREFERENCED_GRACE_DAYS * 86400
+    for path, rel_path in list(media_store.iter_files(media_store.MEDIA_DIR)):
+        if not _is_referenced(rel_path, urls, digests) and os.path.getmtime(path) < grace_cutoff:
+            media_store.discard(path)
+            stats["discarded"] += 1
+
+    trash_cutoff = time.time() - media_store.TRASH_DAYS * 86400
+    for path, rel_path in list(media_store.iter_files(media_store.TRASH_DIR)):
+        if _is_referenced(rel_path, urls, digests):
+            # Lost a race with a deduplicated ingest; put it back
+            media_store.restore(os.path.join(media_store.MEDIA_DIR, *rel_path.split("/")))
+            stats["restored"] += 1
+        elif os.path.getmtime(path) < trash_cutoff:
+            os.remove(path)
+            stats["deleted"] += 1
+
+    return dict(stats)
+
+
+if __name__ == "__main__":
+    db = SessionLocal()
+    try:
+        stats = run_retention(db)
+        print("Media retention: " + (", ".join(f"{k} {v}" for k, v in sorted(stats.items())) or "nothing to do"))
+    finally:
+        db.close()
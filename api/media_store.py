@@ -0,0 +1,230 @@
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+from collections import namedtuple
+
+from PIL import Image, ImageOps
+
+# Served at /media by main.py
+MEDIA_DIR = "media"
+# Not served; archived full-resolution originals of old paid violations
+MEDIA_ARCHIVE_DIR = os.getenv("MEDIA_ARCHIVE_DIR", "media_archive")
+# Not served; upload temp files and discarded media. Must be on the same
+# filesystem as MEDIA_DIR so files can be moved atomically.
+MEDIA_WORK_DIR = os.getenv("MEDIA_WORK_DIR", "media_work")
+TMP_DIR = os.path.join(MEDIA_WORK_DIR, "tmp")
+TRASH_DIR = os.path.join(MEDIA_WORK_DIR, "trash")
+
+THUMBNAIL_SIZE = int(os.getenv("MEDIA_THUMBNAIL_SIZE", "320"))
+# Retention tiers for evidence of paid violations (days, 0 disables the tier)
+RECOMPRESS_AFTER_DAYS = int(os.getenv("MEDIA_RECOMPRESS_AFTER_DAYS", "30"))
+ARCHIVE_AFTER_DAYS = int(os.getenv("MEDIA_ARCHIVE_AFTER_DAYS", "365"))
+RECOMPRESS_MAX_SIZE = int(os.getenv("MEDIA_RECOMPRESS_MAX_SIZE", "1280"))
+RECOMPRESS_QUALITY = int(os.getenv("MEDIA_RECOMPRESS_QUALITY", "60"))
+# Uploads no violation refers to (no plate, unregistered, manual review) are
+# discarded after this many days; discarded files are deleted after TRASH_DAYS.
+UNREFERENCED_GRACE_DAYS = int(os.getenv("MEDIA_UNREFERENCED_GRACE_DAYS", "30"))
+TRASH_DAYS = int(os.getenv("MEDIA_TRASH_DAYS", "7"))
+
+CHUNK_SIZE = 1024 * 1024
+
+# /media/ab/cd/<sha256>[.r].<ext>, or the thumbnail once the original is archived
+_URL_RE = re.compile(r"^/media/(?:thumbs/)?[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})(\.r)?\.[a-z0-9]+$")
+_SHARD_RE = re.compile(r"^[0-9a-f]{2}$")
+
+StoredMedia = namedtuple("StoredMedia", ["digest", "path", "url"])
+
+
+class InvalidImage(ValueError):
+    """The upload is not an image Pillow can read."""
+
+
+def init_dirs():
+    for path in (MEDIA_DIR, TMP_DIR, TRASH_DIR):
+        os.makedirs(path, exist_ok=True)
+
+
+def _shard(digest):
+    return os.path.join(digest[:2], digest[2:4])
+
+
+def _url(rel_path):
+    return "/media/" + rel_path.replace(os.sep, "/")
+
+
+def _extension(path):
+    # Taken from the content, not the upload name, so identical files always share a path
+    try:
+        with Image.open(path) as img:
+            fmt = img.format
+            img.verify()
+    except Exception as e:
+        # Pillow signals unreadable or corrupt data with several exception types
+        raise InvalidImage(str(e))
+    return ".jpg" if fmt == "JPEG" else "." + fmt.lower()
+
+
+def thumbnail_path(digest):
+    return os.path.join(MEDIA_DIR, "thumbs", _shard(digest), digest + ".jpg")
+
+
+def plate_crop_path(digest):
+    return os.path.join(MEDIA_DIR, "plates", _shard(digest), digest + ".jpg")
+
+
+def digest_from_url(url):
+    match = _URL_RE.match(url or "")
+    return match.group(1) if match else None
+
+
+# Derived from the digest alone, without touching the filesystem, since list
+# endpoints call these per row. Both are written at ingest by /detect.
+def thumbnail_url(image_url):
+    """Thumbnail for a stored evidence URL; None for legacy flat uploads."""
+    digest = digest_from_url(image_url)
+    return _url(os.path.join("thumbs", _shard(digest), digest + ".jpg")) if digest else None
+
+
+def plate_crop_url(image_url):
+    """Plate crop for a stored evidence URL; None for legacy flat uploads."""
+    digest = digest_from_url(image_url)
+    return _url(os.path.join("plates", _shard(digest), digest + ".jpg")) if digest else None
+
+
+def local_path(url):
+    return os.path.join(MEDIA_DIR, *url[len("/media/"):].split("/"))
+
+
+def archive_path(url):
+    return os.path.join(MEDIA_ARCHIVE_DIR, _shard(digest_from_url(url)), os.path.basename(local_path(url)))
+
+
+def _trash_path(path):
+    return os.path.join(TRASH_DIR, os.path.relpath(path, MEDIA_DIR))
+
+
+def make_thumbnail(src_path, dest_path):
+    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+    with Image.open(src_path) as img:
+        img = ImageOps.exif_transpose(img).convert("RGB")
+        img.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        img.save(dest_path, "JPEG", quality=80, optimize=True)
+
+
+def save_upload(fileobj):
+    """
+    Store an uploaded image by the SHA-256 of its content under media/ab/cd/.
+    Identical uploads share one file; the thumbnail is created on first ingest.
+    Raises InvalidImage for anything Pillow can't read.
+    """
+    os.makedirs(TMP_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=TMP_DIR)
+    try:
+        digest = hashlib.sha256()
+        with os.fdopen(fd, "wb") as out:
+            for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+                out.write(chunk)
+        digest = digest.hexdigest()
+
+        rel_path = os.path.join(_shard(digest), digest + _extension(tmp_path))
+        path = os.path.join(MEDIA_DIR, rel_path)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+            # Restart the unreferenced-upload grace period for the new ingest
+            os.utime(path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    thumb = thumbnail_path(digest)
+    if not restore(thumb):
+        try:
+            make_thumbnail(path, thumb)
+        except OSError as e:
+            # Keep the evidence; list views fall back to the full image
+            print(f"Thumbnail error for {path}: {e}")
+
+    return StoredMedia(digest, path, _url(rel_path))
+
+
+def recompress(url):
+    """Re-encode a stored original at lower size/quality. Returns the new URL."""
+    digest = digest_from_url(url)
+    rel_path = os.path.join(_shard(digest), digest + ".r.jpg")
+    dest = os.path.join(MEDIA_DIR, rel_path)
+    if not restore(dest):
+        with Image.open(local_path(url)) as img:
+            img = ImageOps.exif_transpose(img).convert("RGB")
+            img.thumbnail((RECOMPRESS_MAX_SIZE, RECOMPRESS_MAX_SIZE))
+            img.save(dest, "JPEG", quality=RECOMPRESS_QUALITY, optimize=True)
+    return _url(rel_path)
+
+
+def archive(url):
+    """Copy a stored original out of the served tree. Returns the archive path."""
+    dest = archive_path(url)
+    if not os.path.exists(dest):
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        shutil.copy2(local_path(url), dest)
+    return dest
+
+
+def discard(path):
+    """
+    Move a served file into the trash instead of deleting it, so an ingest
+    that deduplicated against it in the meantime can still get it back.
+    """
+    dest = _trash_path(path)
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    os.replace(path, dest)
+    # Trash age is counted from the discard
+    os.utime(dest)
+
+
+def restore(path):
+    """Make sure a served file exists, bringing it back from the trash or archive. Returns whether it exists."""
+    if os.path.exists(path):
+        return True
+    trashed = _trash_path(path)
+    if os.path.exists(trashed):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(trashed, path)
+        return True
+    url = _url(os.path.relpath(path, MEDIA_DIR))
+    if digest_from_url(url) and not url.startswith("/media/thumbs/") and os.path.exists(archive_path(url)):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copy2(archive_path(url), path)
+        return True
+    return False
+
+
+def ensure_stored(stored):
+    """Call once a violation referencing `stored` is committed."""
+    restore(stored.path)
+    restore(thumbnail_path(stored.digest))
+    restore(plate_crop_path(stored.digest))
+
+
+def iter_files(root):
+    """Yield (path, rel_path) for every content-addressed file under root (originals, thumbs, plates)."""
+    for sub in ("", "thumbs", "plates"):
+        base = os.path.join(root, sub)
+        if not os.path.isdir(base):
+            continue
+        for a in os.listdir(base):
+            if not _SHARD_RE.match(a):
+                continue
+            for b in os.listdir(os.path.join(base, a)):
+                shard = os.path.join(base, a, b)
+                if not _SHARD_RE.match(b) or not os.path.isdir(shard):
+                    continue
+                for name in os.listdir(shard):
+                    rel_path = "/".join(p for p in (sub, a, b, name) if p)
+                    yield os.path.join(shard, name), rel_path
@@ -48,3 +48,11 @@ class Violation(Base):
     created = Column(DateTime(timezone=True), server_default=func.now())
 
     vehicle = relationship("Vehicle", back_populates="violations")
+
+class UserDataVersion(Base):
+    __tablename__ = "user_data_versions"
+
+    # Shared by all workers so ETags stay valid whichever one serves the request
+    user_id = Column(Integer, primary_key=True)
+    version = Column(Integer, default=0)
+    updated = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,173 @@
+import random
+import threading
+import time
+from concurrent import futures
+
+# HTTP statuses worth retrying (google.api_core errors expose theirs as `code`)
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class OCRUnavailable(Exception):
+    """The remote OCR service could not produce a result (as opposed to "no plate")."""
+
+
+class OCRSaturated(OCRUnavailable):
+    """
+    Too many OCR calls are already in flight in this process. Says nothing
+    about the remote service, so it is neither retried nor counted by the breaker.
+    """
+
+
+def is_retryable(exc):
+    code = getattr(exc, "code", None)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS_CODES
+    # Network failures: built-in ConnectionError/TimeoutError, and the requests
+    # exceptions raised by the REST transport (RequestException is an OSError)
+    return isinstance(exc, (OSError, futures.TimeoutError))
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls
+    until `reset_timeout` seconds pass, then lets a single probe call through.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def is_open(self):
+        with self._lock:
+            return self._opened_at is not None
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if not self._probing and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def release(self):
+        """Give back a half-open probe slot that ended without an outcome."""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class ResilientOCRClient:
+    """
+    Wraps a blocking remote OCR call with a concurrency cap, per-call timeout,
+    jittered retries, a circuit breaker and coalescing of identical in-flight requests.
+
+    `call(*args)` performs one remote request. `fallback(*args)`, if given, is used
+    when the remote call fails for good or the breaker is open; otherwise
+    OCRUnavailable is raised. OCRSaturated is raised when no call slot frees up
+    within `queue_timeout`.
+    """
+
+    def __init__(self, call, fallback=None, max_concurrency=4, timeout=10.0,
+                 queue_timeout=None, max_retries=2, backoff_base=0.5, backoff_max=5.0,
+                 breaker=None, retryable=is_retryable):
+        self.call = call
+        self.fallback = fallback
+        self.timeout = timeout
+        self.queue_timeout = timeout if queue_timeout is None else queue_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self.retryable = retryable
+        # The semaphore is held until the remote call really returns, so calls
+        # abandoned after a timeout still count against the cap.
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._executor = futures.ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="ocr")
+        self._lock = threading.Lock()
+        self._in_flight = {}  # key -> Future shared by callers with the same input
+
+    def read(self, key, *args):
+        with self._lock:
+            shared = self._in_flight.get(key)
+            if shared is None:
+                shared = futures.Future()
+                self._in_flight[key] = shared
+                leader = True
+            else:
+                leader = False
+
+        if not leader:
+            return shared.result()
+
+        try:
+            result = self._read(*args)
+        except BaseException as e:
+            shared.set_exception(e)
+            raise
+        else:
+            shared.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def _read(self, *args):
+        if not self.breaker.allow():
+            return self._fail_over(OCRUnavailable("OCR circuit breaker is open"), args)
+
+        attempt = 0
+        while True:
+            try:
+                result = self._call_once(*args)
+            except OCRSaturated:
+                self.breaker.release()
+                raise
+            except Exception as e:
+                if attempt < self.max_retries and self.retryable(e):
+                    time.sleep(self._backoff(attempt))
+                    attempt += 1
+                    continue
+                self.breaker.record_failure()
+                return self._fail_over(e, args)
+            self.breaker.record_success()
+            return result
+
+    def _call_once(self, *args):
+        if not self._semaphore.acquire(timeout=self.queue_timeout):
+            raise OCRSaturated("OCR concurrency limit reached")
+        try:
+            future = self._executor.submit(self.call, *args)
+        except BaseException:
+            self._semaphore.release()
+            raise
+        future.add_done_callback(lambda f: self._semaphore.release())
+        return future.result(timeout=self.timeout)
+
+    def _backoff(self, attempt):
+        # Full jitter keeps retries from many requests from lining up
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _fail_over(self, exc, args):
+        if self.fallback is not None:
+            return self.fallback(*args)
+        if isinstance(exc, OCRUnavailable):
+            raise exc
+        raise OCRUnavailable(f"Remote OCR failed: {exc!r}") from exc
@@ -1,7 +1,8 @@
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, EmailStr, Field, computed_field
 from typing import List, Optional
 from decimal import Decimal
 from datetime import datetime
+import media_store
 
 # User Profile Schemas
 class UserProfileBase(BaseModel):
@@ -41,7 +42,7 @@ class UserResponse(UserBase):
     id: int
     is_active: bool
     profile: Optional[UserProfileResponse] = None
-    vehicles: List[VehicleResponse] = []
+    vehicles: List["VehicleResponse"] = []
     class Config:
         from_attributes = True
 
@@ -77,6 +78,17 @@ class ViolationResponse(BaseModel):
     class Config:
         from_attributes = True
 
+    # Small variants for list views; None for evidence stored before the media store
+    @computed_field
+    @property
+    def thumbnail(self) -> Optional[str]:
+        return media_store.thumbnail_url(self.image)
+
+    @computed_field
+    @property
+    def plate_image(self) -> Optional[str]:
+        return media_store.plate_crop_url(self.image)
+
 class AdminViolationUpdate(BaseModel):
     amount: Optional[Decimal] = None
     status: Optional[str] = None
@@ -91,3 +103,6 @@ class AdminVehicleCreate(VehicleBase):
 
 class AdminVehicleUpdate(VehicleBase):
     owner_id: Optional[int] = None
+
+# UserResponse refers to VehicleResponse, defined after it
+UserResponse.model_rebuild()
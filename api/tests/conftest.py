@@ -0,0 +1,53 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The API modules are imported as top-level modules, like main.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Keep tests off the development database; set before database.py is imported
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "test.db"))
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A session on empty tables; media paths are relative, so work in tmp_path."""
+    import cache, models
+    from database import SessionLocal, engine
+
+    monkeypatch.chdir(tmp_path)
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    cache._payloads.clear()
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def client(db):
+    from fastapi.testclient import TestClient
+    import main
+
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def make_user(client):
+    """Register a user and return auth headers; `token_seconds` shortens the token's life."""
+    from datetime import timedelta
+    import auth
+
+    def make(username, vehicle_number=None, token_seconds=None):
+        response = client.post("/register", json={
+            "username": username,
+            "email": f"{username}@example.com",
+            "password": "secret",
+            "vehicle_number": vehicle_number,
+        })
+        assert response.status_code == 200, response.text
+        expires = timedelta(seconds=token_seconds) if token_seconds else None
+        token = auth.create_access_token({"sub": username}, expires_delta=expires)
+        return {"Authorization": f"Bearer {token}"}
+    return make
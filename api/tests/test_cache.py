@@ -0,0 +1,100 @@
+from email.utils import format_datetime
+from datetime import datetime, timezone
+
+import pytest
+
+import anpr
+import cache
+from test_media_store import image_bytes
+
+ENDPOINTS = ("/user_dashboard", "/vehicles", "/violations")
+
+
+@pytest.fixture
+def headers(make_user):
+    return make_user("alice", vehicle_number="MH12AB1234")
+
+
+def test_matching_etag_gets_304_without_body(client, headers):
+    first = client.get("/user_dashboard", headers=headers)
+    assert first.status_code == 200
+    assert first.headers["cache-control"] == "private, no-cache"
+    etag = first.headers["etag"]
+
+    response = client.get("/user_dashboard", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+    other = client.get("/user_dashboard", headers={**headers, "If-None-Match": 'W/"0-999"'})
+    assert other.status_code == 200
+    assert other.json() == first.json()
+
+
+def test_add_money_invalidates_the_etag(client, headers):
+    before = client.get("/user_dashboard", headers=headers)
+    assert client.post("/add_money", json={"amount": "50.00"}, headers=headers).status_code == 200
+
+    after = client.get("/user_dashboard", headers={**headers, "If-None-Match": before.headers["etag"]})
+    assert after.status_code == 200
+    assert after.headers["etag"] != before.headers["etag"]
+    assert after.json()["user"]["wallet_balance"] == 50.0
+
+
+def test_detect_invalidates_the_owners_etag(client, headers, monkeypatch):
+    monkeypatch.setattr(anpr, "extract_plate", lambda image_path, crop_path=None: "MH12AB1234")
+    before = client.get("/violations", headers=headers)
+    assert before.json() == []
+
+    response = client.post("/detect", files={"image": ("car.jpg", image_bytes(), "image/jpeg")})
+    assert response.status_code == 200, response.text
+
+    after = client.get("/violations", headers={**headers, "If-None-Match": before.headers["etag"]})
+    assert after.status_code == 200
+    [violation] = after.json()
+    assert violation["status"] == "pending"
+    assert violation["thumbnail"].startswith("/media/thumbs/")
+
+
+def test_if_modified_since_is_honored(client, headers):
+    client.post("/add_money", json={"amount": "5.00"}, headers=headers)
+    first = client.get("/vehicles", headers=headers)
+    last_modified = first.headers["last-modified"]
+
+    response = client.get("/vehicles", headers={**headers, "If-Modified-Since": last_modified})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    earlier = format_datetime(datetime(2001, 1, 1, tzinfo=timezone.utc), usegmt=True)
+    assert client.get("/vehicles", headers={**headers, "If-Modified-Since": earlier}).status_code == 200
+    # If-None-Match takes precedence
+    response = client.get("/vehicles", headers={
+        **headers, "If-Modified-Since": last_modified, "If-None-Match": 'W/"0-999"'
+    })
+    assert response.status_code == 200
+
+
+def test_endpoints_share_the_etag_but_not_the_payload(client, headers, monkeypatch):
+    builds = []
+    encode = cache.jsonable_encoder
+    monkeypatch.setattr(cache, "jsonable_encoder", lambda data: builds.append(1) or encode(data))
+    user_id = client.get("/me", headers=headers).json()["id"]
+
+    responses = {path: client.get(path, headers=headers) for path in ENDPOINTS}
+    assert len({r.headers["etag"] for r in responses.values()}) == 1
+    assert len({r.content for r in responses.values()}) == 3
+    assert set(cache._payloads) == {(user_id, "user_dashboard"), (user_id, "vehicles"), (user_id, "violations")}
+    assert len(builds) == 3
+
+    # Served from the payload cache while the version is unchanged
+    for path in ENDPOINTS:
+        assert client.get(path, headers=headers).content == responses[path].content
+    assert len(builds) == 3
+
+    # One bump invalidates all three
+    etag = responses["/vehicles"].headers["etag"]
+    client.post("/add_money", json={"amount": "5.00"}, headers=headers)
+    assert cache._payloads == {}
+    for path in ENDPOINTS:
+        assert client.get(path, headers={**headers, "If-None-Match": etag}).status_code == 200
+    assert len(builds) == 6
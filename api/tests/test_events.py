@@ -0,0 +1,135 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+import events
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    broker = events.InMemoryBroker()
+    monkeypatch.setattr(events, "_broker", broker)
+    return broker
+
+
+def drain(subscription):
+    items = []
+    while not subscription.queue.empty():
+        items.append(subscription.queue.get_nowait())
+    return items
+
+
+def test_publish_reaches_subscribers_of_the_channel(broker):
+    async def run():
+        first = broker.subscribe("user:1")
+        second = broker.subscribe("user:1")
+        other = broker.subscribe("user:2")
+        # Published from another thread, like the threadpool endpoints do
+        thread = threading.Thread(target=broker.publish, args=("user:1", {"type": "ping", "data": {}}))
+        thread.start()
+        thread.join()
+        assert await asyncio.wait_for(first.get(), 1) == {"type": "ping", "data": {}}
+        assert await asyncio.wait_for(second.get(), 1) == {"type": "ping", "data": {}}
+        assert other.queue.empty()
+
+        first.close()
+        broker.publish("user:1", {"type": "pong", "data": {}})
+        await asyncio.sleep(0)
+        assert first.queue.empty()
+        assert drain(second) == [{"type": "pong", "data": {}}]
+
+        second.close()
+        other.close()
+        assert broker._subscriptions == {}
+    asyncio.run(run())
+
+
+def test_full_queue_drops_the_oldest_events(broker, monkeypatch):
+    monkeypatch.setattr(events, "SUBSCRIBER_QUEUE_SIZE", 3)
+
+    async def run():
+        subscription = broker.subscribe("user:1")
+        for i in range(5):
+            broker.publish("user:1", {"type": "n", "data": i})
+        await asyncio.sleep(0)
+        assert [event["data"] for event in drain(subscription)] == [2, 3, 4]
+    asyncio.run(run())
+
+
+def test_publish_user_event_encodes_data(broker):
+    from decimal import Decimal
+
+    async def run():
+        subscription = broker.subscribe(events.user_channel(7))
+        events.publish_user_event(7, "wallet_credited", {"amount": Decimal("50.00")})
+        event = await asyncio.wait_for(subscription.get(), 1)
+        assert events.format_sse(event) == 'event: wallet_credited\ndata: {"amount": 50.0}\n\n'
+    asyncio.run(run())
+
+
+def parse_sse(text):
+    """(event, data) pairs of a finished stream; keep-alive comments are skipped."""
+    parsed = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n") if not line.startswith(":"))
+        if lines:
+            parsed.append((lines["event"], json.loads(lines["data"])))
+    return parsed
+
+
+def open_stream(client, headers):
+    """Read /events in a thread; the stream ends when the token expires."""
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(response=client.get("/events", headers=headers)))
+    thread.start()
+    return thread, result
+
+
+def wait_for_subscriber(broker, user_id):
+    deadline = time.monotonic() + 5
+    while not broker._subscriptions.get(events.user_channel(user_id)):
+        assert time.monotonic() < deadline, "stream never subscribed"
+        time.sleep(0.01)
+
+
+def test_stream_requires_authentication(client, broker):
+    assert client.get("/events").status_code == 401
+    assert client.get("/events", headers={"Authorization": "Bearer not-a-token"}).status_code == 401
+    assert broker._subscriptions == {}
+
+
+def test_stream_delivers_wallet_events_until_the_token_expires(client, broker, make_user):
+    headers = make_user("alice", token_seconds=2)
+    user_id = client.get("/me", headers=headers).json()["id"]
+
+    thread, result = open_stream(client, headers)
+    wait_for_subscriber(broker, user_id)
+    assert client.post("/add_money", json={"amount": "100.00"}, headers=headers).status_code == 200
+    thread.join(10)
+    assert not thread.is_alive()
+
+    response = result["response"]
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert parse_sse(response.text) == [
+        ("wallet_credited", {"amount": 100.0, "wallet_balance": 100.0}),
+        ("token_expired", {}),
+    ]
+    # The subscription goes away with the stream
+    assert broker._subscriptions == {}
+
+
+def test_stream_ends_with_token_expired(client, broker, make_user):
+    headers = make_user("bob", token_seconds=1)
+    other = make_user("carol")
+
+    thread, result = open_stream(client, headers)
+    wait_for_subscriber(broker, client.get("/me", headers=headers).json()["id"])
+    # Another user's events don't reach this stream
+    client.post("/add_money", json={"amount": "10.00"}, headers=other)
+    thread.join(10)
+    assert not thread.is_alive()
+    assert parse_sse(result["response"].text) == [("token_expired", {})]
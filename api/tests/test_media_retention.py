@@ -0,0 +1,120 @@
+import io
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import media_store
+import models
+from media_retention import run_retention
+from test_media_store import image_bytes
+
+CREATED = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def add_violation(db, url, status="paid", plate="MH12AB1234", created=CREATED):
+    user = db.query(models.User).filter(models.User.username == plate).first()
+    if user is None:
+        user = models.User(username=plate, email=f"{plate}@example.com", password="secret")
+        db.add(user)
+        db.commit()
+        db.add(models.Vehicle(user_id=user.id, plate_number=plate))
+        db.commit()
+    vehicle = db.query(models.Vehicle).filter(models.Vehicle.plate_number == plate).first()
+    violation = models.Violation(vehicle_id=vehicle.id, image=url, amount=Decimal("500.00"),
+                                 status=status, created=created)
+    db.add(violation)
+    db.commit()
+    return violation
+
+
+def age(path, days):
+    past = time.time() - days * 86400
+    os.utime(path, (past, past))
+
+
+def served(url):
+    return os.path.exists(media_store.local_path(url))
+
+
+def test_paid_evidence_is_recompressed_then_archived(db):
+    stored = media_store.save_upload(io.BytesIO(image_bytes()))
+    violation = add_violation(db, stored.url)
+
+    stats = run_retention(db, now=CREATED + timedelta(days=media_store.RECOMPRESS_AFTER_DAYS + 1))
+    db.refresh(violation)
+    assert stats == {"recompressed": 1}
+    assert violation.image.endswith(".r.jpg")
+    assert served(violation.image)
+    # The full-resolution original is archived first, then leaves the served tree
+    assert os.path.exists(media_store.archive_path(stored.url))
+    assert not served(stored.url)
+
+    recompressed = violation.image
+    stats = run_retention(db, now=CREATED + timedelta(days=media_store.ARCHIVE_AFTER_DAYS + 1))
+    db.refresh(violation)
+    assert stats == {"archived": 1}
+    assert violation.image == media_store.thumbnail_url(stored.url)
+    assert served(violation.image)
+    assert not served(recompressed)
+
+    # Nothing left to do
+    assert run_retention(db, now=CREATED + timedelta(days=media_store.ARCHIVE_AFTER_DAYS + 2)) == {}
+
+
+def test_recent_evidence_is_kept(db):
+    stored = media_store.save_upload(io.BytesIO(image_bytes()))
+    add_violation(db, stored.url)
+    assert run_retention(db, now=CREATED + timedelta(days=1)) == {}
+    assert served(stored.url)
+
+
+def test_shared_evidence_with_an_unpaid_violation_is_not_tiered(db):
+    stored = media_store.save_upload(io.BytesIO(image_bytes()))
+    paid = add_violation(db, stored.url, plate="MH12AB1234")
+    pending = add_violation(db, stored.url, status="pending", plate="GJ05CD5678")
+
+    assert run_retention(db, now=CREATED + timedelta(days=media_store.ARCHIVE_AFTER_DAYS + 1)) == {}
+    db.refresh(paid)
+    db.refresh(pending)
+    assert paid.image == pending.image == stored.url
+    assert served(stored.url)
+
+
+def test_unreferenced_upload_is_discarded_then_deleted(db):
+    # e.g. no plate found, or a manual-review upload nobody followed up on
+    stored = media_store.save_upload(io.BytesIO(image_bytes()))
+    thumb = media_store.thumbnail_path(stored.digest)
+
+    # Still inside the grace period
+    assert run_retention(db) == {}
+    assert served(stored.url)
+
+    age(stored.path, media_store.UNREFERENCED_GRACE_DAYS + 1)
+    age(thumb, media_store.UNREFERENCED_GRACE_DAYS + 1)
+    assert run_retention(db) == {"discarded": 2}
+    assert not served(stored.url)
+    assert not os.path.exists(thumb)
+    trashed = [path for path, _ in media_store.iter_files(media_store.TRASH_DIR)]
+    assert len(trashed) == 2
+
+    # Trash age counts from the discard
+    assert run_retention(db) == {}
+    for path in trashed:
+        age(path, media_store.TRASH_DAYS + 1)
+    assert run_retention(db) == {"deleted": 2}
+    assert list(media_store.iter_files(media_store.TRASH_DIR)) == []
+
+
+def test_trashed_evidence_is_restored_once_referenced(db):
+    stored = media_store.save_upload(io.BytesIO(image_bytes()))
+    age(stored.path, media_store.UNREFERENCED_GRACE_DAYS + 1)
+    age(media_store.thumbnail_path(stored.digest), media_store.UNREFERENCED_GRACE_DAYS + 1)
+    assert run_retention(db) == {"discarded": 2}
+
+    # A deduplicated ingest committed a violation for the same file meanwhile
+    add_violation(db, stored.url, status="pending")
+    assert run_retention(db) == {"restored": 2}
+    assert served(stored.url)
+    assert os.path.exists(media_store.thumbnail_path(stored.digest))
+    assert list(media_store.iter_files(media_store.TRASH_DIR)) == []
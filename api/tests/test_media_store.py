@@ -0,0 +1,56 @@
+import io
+import os
+
+import pytest
+from PIL import Image
+
+import media_store
+
+
+def image_bytes(color=(200, 30, 30), fmt="JPEG"):
+    out = io.BytesIO()
+    Image.new("RGB", (64, 48), color).save(out, fmt)
+    return out.getvalue()
+
+
+def test_save_upload_is_content_addressed(db):
+    first = media_store.save_upload(io.BytesIO(image_bytes()))
+    second = media_store.save_upload(io.BytesIO(image_bytes()))
+    assert first == second
+    assert first.url == f"/media/{first.digest[:2]}/{first.digest[2:4]}/{first.digest}.jpg"
+    assert os.path.exists(first.path)
+    assert os.path.exists(media_store.thumbnail_path(first.digest))
+    assert os.listdir(media_store.TMP_DIR) == []
+
+
+def test_save_upload_rejects_non_images(db):
+    with pytest.raises(media_store.InvalidImage):
+        media_store.save_upload(io.BytesIO(b"<html>not an image</html>"))
+    assert os.listdir(media_store.TMP_DIR) == []
+    assert list(media_store.iter_files(media_store.MEDIA_DIR)) == []
+
+
+def test_derived_urls():
+    digest = "ab" * 32
+    url = f"/media/ab/ab/{digest}.png"
+    assert media_store.thumbnail_url(url) == f"/media/thumbs/ab/ab/{digest}.jpg"
+    assert media_store.plate_crop_url(url) == f"/media/plates/ab/ab/{digest}.jpg"
+    # Archived evidence is served as its thumbnail
+    assert media_store.thumbnail_url(media_store.thumbnail_url(url)) == media_store.thumbnail_url(url)
+    assert media_store.thumbnail_url("/media/legacy_upload.jpg") is None
+
+
+def test_ensure_stored_restores_files_discarded_during_ocr(db):
+    stored = media_store.save_upload(io.BytesIO(image_bytes()))
+    crop = media_store.plate_crop_path(stored.digest)
+    media_store.make_thumbnail(stored.path, crop)
+
+    # Retention discarded the (still unreferenced) upload while OCR was running
+    for path in (stored.path, media_store.thumbnail_path(stored.digest), crop):
+        media_store.discard(path)
+        assert not os.path.exists(path)
+
+    media_store.ensure_stored(stored)
+    for path in (stored.path, media_store.thumbnail_path(stored.digest), crop):
+        assert os.path.exists(path)
+    assert list(media_store.iter_files(media_store.TRASH_DIR)) == []
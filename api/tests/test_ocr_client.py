@@ -0,0 +1,186 @@
+import json
+import threading
+import time
+import urllib.request
+
+import numpy as np
+import pytest
+
+from fake_ocr_server import FakeOCRServer
+from ocr_client import CircuitBreaker, OCRSaturated, OCRUnavailable, ResilientOCRClient, is_retryable
+
+
+@pytest.fixture
+def server():
+    server = FakeOCRServer().start()
+    yield server
+    server.stop()
+
+
+def remote_ocr(server):
+    """Blocking generateContent call against the fake server, like the Gemini REST client."""
+    def call(image):
+        request = urllib.request.Request(
+            server.url + "/v1beta/models/gemini-flash-latest:generateContent",
+            data=json.dumps({"contents": [{"parts": [{"text": image}]}]}).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        # HTTPError carries the status as `code`, like google.api_core errors
+        with urllib.request.urlopen(request, timeout=5) as response:
+            body = json.load(response)
+        return body["candidates"][0]["content"]["parts"][0]["text"]
+    return call
+
+
+def make_client(server, **kwargs):
+    kwargs.setdefault("backoff_base", 0.01)
+    return ResilientOCRClient(remote_ocr(server), **kwargs)
+
+
+def test_reads_plate_text(server):
+    client = make_client(server)
+    assert client.read("a", "crop") == "MH12AB1234"
+    assert server.hits == 1
+
+
+def test_retries_retryable_errors(server):
+    server.script = [503, 429]
+    client = make_client(server)
+    assert client.read("a", "crop") == "MH12AB1234"
+    assert server.hits == 3
+    assert not client.breaker.is_open
+
+
+def test_does_not_retry_client_errors(server):
+    server.script = [400]
+    client = make_client(server)
+    with pytest.raises(OCRUnavailable):
+        client.read("a", "crop")
+    assert server.hits == 1
+
+
+def test_timeout_is_retried_then_fails(server):
+    server.delay = 0.3
+    client = make_client(server, timeout=0.1, max_retries=1)
+    with pytest.raises(OCRUnavailable):
+        client.read("a", "crop")
+    # Abandoned calls finish in the background; wait for the second attempt to arrive
+    time.sleep(0.2)
+    assert server.hits == 2
+
+
+def test_breaker_opens_and_uses_fallback(server):
+    server.script = [500] * 4
+    client = make_client(server, max_retries=1, breaker=CircuitBreaker(2, 0.2),
+                         fallback=lambda image: "FALLBACK")
+    assert client.read("a", "crop") == "FALLBACK"
+    assert client.read("b", "crop") == "FALLBACK"
+    assert client.breaker.is_open
+    hits = server.hits
+    assert client.read("c", "crop") == "FALLBACK"
+    assert server.hits == hits
+
+    # After the reset timeout one probe goes through and closes the breaker
+    time.sleep(0.25)
+    assert client.read("d", "crop") == "MH12AB1234"
+    assert not client.breaker.is_open
+
+
+def test_coalesces_identical_in_flight_requests(server):
+    server.delay = 0.3
+    client = make_client(server)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(client.read("same", "crop"))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == ["MH12AB1234"] * 5
+    assert server.hits == 1
+
+
+def test_saturation_is_not_a_remote_failure(server):
+    server.delay = 0.5
+    client = make_client(server, max_concurrency=1, queue_timeout=0.05,
+                         breaker=CircuitBreaker(1, 60), fallback=lambda image: "FALLBACK")
+    first = threading.Thread(target=client.read, args=("a", "crop"))
+    first.start()
+    time.sleep(0.1)
+    with pytest.raises(OCRSaturated):
+        client.read("b", "crop")
+    first.join()
+    assert not client.breaker.is_open
+    assert server.hits == 1
+
+
+# The tests below go through anpr._gemini_generate and the real genai REST
+# client, pointed at the fake server like GEMINI_API_ENDPOINT does.
+
+@pytest.fixture
+def gemini(monkeypatch):
+    import google.generativeai as genai
+    import anpr
+
+    def point_at(url):
+        genai.configure(api_key="test-key", transport="rest", client_options={"api_endpoint": url})
+        monkeypatch.setattr(anpr, "gemini_model", genai.GenerativeModel("gemini-flash-latest"))
+        return anpr._gemini_generate
+    return point_at
+
+
+def crop():
+    return np.zeros((40, 120, 3), dtype=np.uint8)
+
+
+def test_real_client_reads_plate_text(server, gemini):
+    assert gemini(server.url)(crop()) == "MH12AB1234"
+    assert server.hits == 1
+
+
+def test_real_client_does_not_retry_on_its_own(server, gemini):
+    server.script = [503]
+    generate = gemini(server.url)
+    with pytest.raises(Exception) as info:
+        generate(crop())
+    assert is_retryable(info.value)
+    assert server.hits == 1
+
+    server.script = [503, 503, 503]
+    client = ResilientOCRClient(generate, max_retries=2, backoff_base=0.01)
+    with pytest.raises(OCRUnavailable):
+        client.read("a", crop())
+    assert server.hits == 4
+
+
+def test_real_client_server_down_is_retried(gemini):
+    down = FakeOCRServer().start()
+    url = down.url
+    down.stop()
+    generate = gemini(url)
+    with pytest.raises(Exception) as info:
+        generate(crop())
+    assert is_retryable(info.value)
+
+    attempts = []
+    def counted(image):
+        attempts.append(1)
+        return generate(image)
+    client = ResilientOCRClient(counted, max_retries=2, backoff_base=0.01)
+    with pytest.raises(OCRUnavailable):
+        client.read("a", crop())
+    assert len(attempts) == 3
+
+
+def test_real_client_slow_server_is_retried(server, gemini, monkeypatch):
+    import anpr
+    monkeypatch.setattr(anpr, "OCR_TIMEOUT_SECONDS", 0.1)
+    server.delay = 0.3
+    generate = gemini(server.url)
+    with pytest.raises(Exception) as info:
+        generate(crop())
+    assert is_retryable(info.value)
+
+    client = ResilientOCRClient(generate, max_retries=1, backoff_base=0.01)
+    with pytest.raises(OCRUnavailable):
+        client.read("a", crop())
+    assert server.hits == 3